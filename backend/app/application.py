@@ -3,6 +3,7 @@
 Main application setup for the FastAPI starter template
 """
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.models import SecuritySchemeType
 from contextlib import asynccontextmanager
@@ -11,7 +12,7 @@ import traceback
 import sys
 
 from app.config import settings
-from app.api.routes import router as api_router
+from app.api.routes import router as api_router, chat_service
 from app.auth.routes import router as auth_router
 from app.database.mongodb import init_db, close_db_connection
 from app.models.user import User
@@ -48,11 +49,15 @@ async def lifespan(app: FastAPI):
         
         yield
     except Exception as e:
-        logger.error(f"Error during application startup: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error during application startup: %s", e)
         # We still yield to allow FastAPI to handle the error appropriately
         yield
     finally:    
+        # Close the LLM clients' shared connection pool
+        try:
+            await chat_service.aclose()
+        except Exception as e:
+            logger.warning("Error closing LLM HTTP client: %s", e)
         # Close database connection
         logger.info("Shutting down application, closing database connection")
         try:
@@ -75,6 +80,8 @@ def create_application() -> FastAPI:
         description="A production-ready FastAPI starter template with MongoDB integration and JWT authentication",
         version="1.0.0",
         lifespan=lifespan,
+        # orjson serializes response bodies (including datetimes) natively
+        default_response_class=ORJSONResponse,
         # Define tags for API documentation
         openapi_tags=[
             {"name": "Authentication", "description": "Authentication endpoints"},
@@ -134,8 +141,7 @@ def create_application() -> FastAPI:
             logger.info("Health check endpoint called")
             return {"status": "healthy", "message": "API is running"}
         except Exception as e:
-            logger.error(f"Error in health check: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error in health check: %s", e)
             # Return status code 200 with error details to help with debugging
             return {"status": "error", "message": str(e), "traceback": traceback.format_exc()}
     
@@ -148,7 +154,6 @@ try:
     app = create_application()
     logger.info("Application instance created successfully")
 except Exception as e:
-    logger.critical(f"Failed to create application instance: {str(e)}")
-    logger.critical(traceback.format_exc())
+    logger.critical("Failed to create application instance: %s", e, exc_info=True)
     # Re-raise to prevent app startup
     raise
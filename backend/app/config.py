@@ -44,6 +44,7 @@ class Settings(BaseModel):
     # LLM settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4o-mini")  # Default model, configurable
+    LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.7"))  # 0 enables the chat response cache
     
     # MongoDB settings
     MONGODB_CHECKPOINT_COLLECTION: str = os.getenv("MONGODB_CHECKPOINT_COLLECTION", "chat_memory")
@@ -16,9 +16,19 @@ load_dotenv(dotenv_path=os.path.join(app_dir, '.env'))
 # MongoDB Atlas connection settings from environment variables
 MONGODB_URI = os.getenv("MONGODB_URI")
 DATABASE_NAME = os.getenv("MONGODB_DATABASE")
-
-# MongoDB client with server API version 1
-client = AsyncIOMotorClient(MONGODB_URI, server_api=ServerApi('1'))
+# Connection pool bounds (pymongo defaults: no minimum, at most 100 connections)
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+
+# MongoDB client with server API version 1. Dates are read back as UTC-aware datetimes, like
+# the ones the app writes, so every endpoint serializes timestamps with the same offset.
+client = AsyncIOMotorClient(
+    MONGODB_URI,
+    server_api=ServerApi('1'),
+    minPoolSize=MONGODB_MIN_POOL_SIZE,
+    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+    tz_aware=True
+)
 db = client[DATABASE_NAME]
 
 
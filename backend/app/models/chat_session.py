@@ -2,7 +2,7 @@
 """
 Pydantic and Beanie models for chat sessions
 """
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Optional
 from beanie import Document
 from pydantic import BaseModel, Field
@@ -13,9 +13,10 @@ class ChatSessionMetadata(Document):
     session_id: str = Field(..., description="Unique session identifier")
     username: str = Field(..., description="Username of the session owner")
     name: str = Field(default="New Chat", description="User-friendly name for the session")
-    created_at: datetime = Field(default_factory=datetime.now, description="When the session was created")
-    updated_at: datetime = Field(default_factory=datetime.now, description="When the session was last updated")
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), description="When the session was created")
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), description="When the session was last updated")
     message_count: int = Field(default=0, description="Number of messages in the session")
+    checkpoint_step: Optional[int] = Field(default=None, description="Conversation checkpoint step message_count was last set from")
     
     class Settings:
         name = "chat_sessions"
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+LangGraph checkpointer that keeps chat session metadata in step with the conversation
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+
+from app.models.chat_session import ChatSessionMetadata
+
+logger = logging.getLogger(__name__)
+
+# Strong references to in-flight background tasks; the event loop only keeps weak ones
+_background_tasks = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """Schedule a coroutine without awaiting it, logging any exception it raises"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background task failed", exc_info=task.exception())
+
+
+def conversation_message_count(channel_values: dict) -> int:
+    """Count every message in a conversation, including those folded into its summary"""
+    return len(channel_values.get("messages", [])) + channel_values.get("summarized_messages", 0)
+
+
+class SessionTrackingMongoDBSaver(AsyncMongoDBSaver):
+    """AsyncMongoDBSaver that also updates the session's message_count and updated_at
+
+    The metadata update runs as a background task once the checkpoint is written, so a chat
+    turn never waits on the chat_sessions collection.
+    """
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        """Save a checkpoint and, for node steps that changed the messages, the session metadata"""
+        next_config = await super().aput(config, checkpoint, metadata, new_versions)
+
+        # Only graph steps ("loop") that wrote to the messages channel change the conversation
+        if metadata.get("source") == "loop" and "messages" in new_versions:
+            session_id = config["configurable"]["thread_id"]
+            message_count = conversation_message_count(checkpoint["channel_values"])
+            # Not on the response's critical path, so don't make the turn wait for it
+            run_in_background(
+                self._update_session_metadata(
+                    session_id, metadata["step"], message_count, datetime.now(timezone.utc)
+                )
+            )
+
+        return next_config
+
+    async def _update_session_metadata(
+        self, session_id: str, step: int, message_count: int, updated_at: datetime
+    ) -> None:
+        """Record the session's message count as of a checkpoint step, unless a later step already did"""
+        try:
+            # Background updates may land out of order. A thread's checkpoint steps only increase,
+            # so the step guard keeps the newest count; sessions without a step yet always match.
+            await ChatSessionMetadata.get_motor_collection().update_one(
+                {"session_id": session_id, "checkpoint_step": {"$not": {"$gte": step}}},
+                {"$set": {"message_count": message_count, "updated_at": updated_at, "checkpoint_step": step}}
+            )
+        except Exception as e:
+            # Metadata is best effort; never fail the checkpoint write because of it
+            logger.warning("Failed to update session metadata for %s: %s", session_id, e)
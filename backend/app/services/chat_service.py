@@ -2,37 +2,24 @@
 Chat service with session memory using LangGraph, aligned with official docs 
 continue https://grok.com/chat/fae2d08b-32cd-47f3-8f13-78f417251d6a
 """
+import asyncio
 import json
 import logging
-import threading
-import traceback
 import uuid
-from datetime import datetime
-from typing import Optional, Tuple, List
-
-from langgraph.checkpoint.mongodb import MongoDBSaver
-from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
-from functools import wraps
-
-# Handle different import paths based on environment
-try:
-    from langgraph.checkpoint.mongodb import MongoDBSaver
-    from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
-except ImportError:
-    try:
-        from langgraph_checkpoint_mongodb import MongoDBSaver
-        from langgraph_checkpoint_mongodb.aio import AsyncMongoDBSaver
-    except ImportError:
-        logging.error("Could not import MongoDB checkpoint functionality. "
-                     "Make sure either langgraph with MongoDB support or "
-                     "langgraph-checkpoint-mongodb is installed.")
-        raise
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple, List
+
+import httpx
+from pymongo import ReturnDocument
+from langchain_core.messages import HumanMessage, SystemMessage
+from tenacity import retry, stop_after_attempt, wait_exponential, before_sleep_log
 
 from app.config import settings
 from app.database.mongodb import client as mongo_client, DATABASE_NAME
 from app.models.chat_session import ChatSessionMetadata
-from app.services.chat_workflow import build_chat_graph  # Import the graph builder
+from app.services.chat_checkpointer import SessionTrackingMongoDBSaver
+from app.services.chat_workflow import REPLY_NODES, build_chat_graph, warm_encoding  # Import the graph builder
+from app.services.lru_cache import LRUCache
 
 # Set higher logging level for noisy libraries
 logging.getLogger('pymongo').setLevel(logging.WARNING)
@@ -40,34 +27,29 @@ logging.getLogger('passlib').setLevel(logging.WARNING)
 logging.getLogger('jwt').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# System prompt for session title generation, built once
+TITLE_SYSTEM_MESSAGE = SystemMessage(
+    content="Based on this conversation, generate an ultra short, descriptive title, max 3 words. "
+            "Respond with ONLY the title, no quotes or explanations."
+)
+
 # Track active sessions for concurrent request analysis
+# Only mutated from the event loop thread between awaits, so no lock is needed
 active_sessions = {}
-active_sessions_lock = threading.Lock()
 
 # Define a reusable retry decorator for database operations
 def with_database_retry(operation_name=None):
-    def decorator(func):
-        @retry(
-            stop=stop_after_attempt(3),
-            wait=wait_exponential(multiplier=1, min=4, max=10),
-            retry=retry_if_exception_type(Exception),
-            before=lambda retry_state: logger.debug(
-                f"Attempt {retry_state.attempt_number} for {operation_name or func.__name__}"
-            ),
-            after=lambda retry_state: logger.debug(
-                f"Completed {operation_name or func.__name__} after {retry_state.attempt_number} attempts"
-            )
-        )
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            try:
-                return await func(*args, **kwargs)
-            except Exception as e:
-                logger.error(f"Error in {operation_name or func.__name__}: {str(e)}")
-                raise
-        return wrapper
-    return decorator
+    """Retry a database coroutine up to 3 times, re-raising the original exception on the last failure
 
+    tenacity logs each retry (with the wrapped function's name) before sleeping; operation_name is
+    kept for call-site readability.
+    """
+    return retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=0.5, min=0.5, max=2),
+        reraise=True,
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+    )
 
 
 class ChatService:
@@ -81,7 +63,15 @@ class ChatService:
 
         # Placeholder for async-initialized memory
         self.memory = None
+        self._checkpoints_coll = None
         self._memory_initialized = False
+        # Serializes first-time initialization so concurrent first requests build the saver once
+        self._memory_lock = asyncio.Lock()
+
+        # session_id -> (updated_at, formatted messages) for get_session_history
+        self._history_cache = LRUCache(maxsize=512)
+        # session_id -> generated title, so repeated title requests skip the LLM
+        self._title_cache = LRUCache(maxsize=512)
 
         # MongoDB client and DB params for memory checkpoints
         self._memory_params = {
@@ -90,53 +80,88 @@ class ChatService:
             "collection_name": settings.MONGODB_CHECKPOINT_COLLECTION
         }
 
+        # One connection pool shared by every LLM client, so TLS sessions are reused across them
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+
         # Initialize the LLM
         try:
             from langchain_openai import ChatOpenAI
             self.llm = ChatOpenAI(
                 model=settings.LLM_MODEL,
                 api_key=settings.OPENAI_API_KEY,
-                temperature=0.7,
+                temperature=settings.LLM_TEMPERATURE,
                 max_tokens=500,
+                http_async_client=self._http_client,
             )
             logger.info(f"Initialized ChatOpenAI with model: {settings.LLM_MODEL}")
+
+            # Dedicated client for session titles with its options baked in
+            self._title_llm = ChatOpenAI(
+                model=settings.LLM_MODEL,
+                api_key=settings.OPENAI_API_KEY,
+                temperature=0.7,
+                max_tokens=10,  # Keep titles short
+                timeout=15,
+                http_async_client=self._http_client,
+            )
         except Exception as e:
-            logger.error(f"Failed to initialize ChatOpenAI: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Failed to initialize ChatOpenAI: %s", e)
             raise
 
-        # Build the graph with temporary synchronous memory saver
-        temp_memory = MongoDBSaver(
-            client=self._memory_params["client"],
-            db_name=self._memory_params["db_name"],
-            collection_name=self._memory_params["collection_name"]
-        )
-        self.graph = build_chat_graph(self.llm, temp_memory)
-        logger.info("ChatService initialized with temporary memory saver")
+        # The graph is compiled once, around the async saver, by _ensure_memory
+        self.graph = None
+        logger.info("ChatService initialized; memory and graph are built on first use")
     
 
         
+    async def aclose(self):
+        """Close the shared HTTP connection pool used by the LLM clients."""
+        await self._http_client.aclose()
+
     # Memory Management
     async def initialize_async_memory(self):
         """Initialize the AsyncMongoDBSaver in an async context."""
-        if hasattr(self, "_memory_initialized") and self._memory_initialized:
-            logger.debug("AsyncMongoDBSaver already initialized")
+        await self._ensure_memory()
+
+    async def _ensure_memory(self):
+        """Double-checked initialization: lock-free once ready, single initializer before that."""
+        if self._memory_initialized:
             return
+        async with self._memory_lock:
+            # Another request may have finished initialization while we waited for the lock
+            if self._memory_initialized:
+                return
+            await self._init_memory()
+
+    async def _init_memory(self):
+        """Create the AsyncMongoDBSaver and build the graph around it. Caller holds _memory_lock."""
         try:
             logger.info("Initializing AsyncMongoDBSaver in async context")
-            self.memory = AsyncMongoDBSaver(
+            # Also keeps chat_sessions.message_count/updated_at current as part of each checkpoint write
+            self.memory = SessionTrackingMongoDBSaver(
                 client=self._memory_params["client"],
                 db_name=self._memory_params["db_name"],
                 collection_name=self._memory_params["collection_name"]
             )
-            self._memory_initialized = True
             logger.info("AsyncMongoDBSaver initialized successfully")
-            # Rebuild the graph with the async memory saver
+            # Resolve the checkpoint collection once and make "latest checkpoint for a thread" an index seek
+            self._checkpoints_coll = self.memory.checkpoint_collection
+            await self._checkpoints_coll.create_index(
+                [("thread_id", 1), ("checkpoint_ns", 1), ("checkpoint_id", -1)]
+            )
+            # Compile the graph once, around the async memory saver
             self.graph = build_chat_graph(self.llm, self.memory)
-            logger.info("Graph rebuilt with AsyncMongoDBSaver")
+            # Prompts are trimmed with estimated token counts until the encoding has loaded
+            warm_encoding(getattr(self.llm, "model_name", ""))
+            logger.info("Graph built with AsyncMongoDBSaver")
+            # Only flag as ready once the graph uses the async saver
+            self._memory_initialized = True
         except Exception as e:
-            logger.error(f"Error initializing AsyncMongoDBSaver: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error initializing AsyncMongoDBSaver: %s", e)
             raise
     
     async def get_chat_response(self, message: str, session_id: str) -> str | Tuple[str, Optional[str]]:
@@ -150,34 +175,70 @@ class ChatService:
         Returns:
             str: The assistant's response.
         """
-        if not self._memory_initialized:
-            await self.initialize_async_memory()
+        await self._ensure_memory()
 
         config = {"configurable": {"thread_id": session_id}}
         input_state = {"messages": [{"role": "user", "content": message}]}
 
         try:
-            with active_sessions_lock:
-                active_sessions[session_id] = active_sessions.get(session_id, 0) + 1
-            logger.debug(f"Active sessions: {len(active_sessions)}")
+            active_sessions[session_id] = active_sessions.get(session_id, 0) + 1
+            logger.debug("Active sessions: %d", len(active_sessions))
 
+            # ainvoke returns the final graph state, so there is no need to re-read the checkpoint
             output = await self.graph.ainvoke(input_state, config)
-            checkpoint = await self.graph.aget_state(config)
-            response = checkpoint.values["messages"][-1].content
+            response = output["messages"][-1].content
+
+            # The checkpoint now has new messages; don't serve the old history until updated_at catches up
+            self._history_cache.pop(session_id)
 
-            logger.info(f"Generated response for session {session_id}: {response[:100]}...")
+            logger.info("Generated response for session %s: %.100s...", session_id, response)
             return response
 
         except Exception as e:
-            logger.error(f"Error generating chat response: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error generating chat response: %s", e)
             return "I'm sorry, I encountered an error processing your request."
         finally:
-            with active_sessions_lock:
-                active_sessions[session_id] -= 1
-                if active_sessions[session_id] <= 0:
-                    del active_sessions[session_id]
-            logger.debug(f"Active sessions after cleanup: {len(active_sessions)}")
+            active_sessions[session_id] -= 1
+            if active_sessions[session_id] <= 0:
+                del active_sessions[session_id]
+            logger.debug("Active sessions after cleanup: %d", len(active_sessions))
+
+    async def stream_chat_response(self, message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Process a chat message and yield the response as it is generated.
+
+        Args:
+            message: The user's input message.
+            session_id: Unique identifier for the chat session.
+
+        Yields:
+            str: Pieces of the assistant's response, in order.
+
+        Raises:
+            Exception: If the response fails partway; the pieces already yielded are incomplete.
+        """
+        await self._ensure_memory()
+
+        config = {"configurable": {"thread_id": session_id}}
+        input_state = {"messages": [{"role": "user", "content": message}]}
+
+        try:
+            active_sessions[session_id] = active_sessions.get(session_id, 0) + 1
+
+            # "messages" mode yields LLM tokens as they arrive, and locally built replies whole
+            async for chunk, metadata in self.graph.astream(input_state, config, stream_mode="messages"):
+                if metadata.get("langgraph_node") in REPLY_NODES and chunk.content:
+                    yield chunk.content
+
+            self._history_cache.pop(session_id)
+        except Exception as e:
+            # Re-raised rather than yielded as text, so callers can tell a failed reply from a finished one
+            logger.exception("Error streaming chat response: %s", e)
+            raise
+        finally:
+            active_sessions[session_id] -= 1
+            if active_sessions[session_id] <= 0:
+                del active_sessions[session_id]
 
     ## Sessions Mgmnt
     @with_database_retry(operation_name="generate_session_id")
@@ -214,30 +275,22 @@ class ChatService:
         """
         session_id = await self.generate_session_id(username)
         
-        # Create session metadata document
-        session = ChatSessionMetadata(
-            session_id=session_id,
-            username=username,
-            name=session_name,
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
-            message_count=0
-        )
+        # Create session metadata document; all fields are set here, so skip Beanie's model round-trip
+        now = datetime.now(timezone.utc)
+        session = {
+            "session_id": session_id,
+            "name": session_name,
+            "created_at": now,
+            "updated_at": now,
+            "message_count": 0
+        }
         
         # Insert the session document
-        await session.insert()
+        await ChatSessionMetadata.get_motor_collection().insert_one({**session, "username": username})
         logger.info(f"Created new session {session_id} for user {username}")
-        persisted = True
         
         # Return session data with persistence status
-        return {
-            "session_id": session.session_id,
-            "name": session.name,
-            "created_at": session.created_at,
-            "updated_at": session.updated_at,
-            "message_count": session.message_count,
-            "persisted": persisted
-        }
+        return {**session, "persisted": True}
     
     @with_database_retry(operation_name="list_user_sessions")
     async def list_user_sessions(self, username: str) -> List[dict]:
@@ -250,139 +303,118 @@ class ChatService:
             List of session metadata dictionaries
         """
         # Find all sessions for this user, sorted by updated_at (newest first)
-        sessions = await ChatSessionMetadata.find(
-            ChatSessionMetadata.username == username
-        ).sort([("updated_at", -1)]).to_list()
-        
-        # Convert to dictionaries
-        return [
-            {
-                "session_id": session.session_id,
-                "name": session.name,
-                "created_at": session.created_at,
-                "updated_at": session.updated_at,
-                "message_count": session.message_count
+        # The (username, updated_at) compound index serves both the filter and the sort,
+        # and the projection returns exactly the fields in the response
+        cursor = ChatSessionMetadata.get_motor_collection().find(
+            {"username": username},
+            projection={
+                "_id": 0,
+                "session_id": 1,
+                "name": 1,
+                "created_at": 1,
+                "updated_at": 1,
+                "message_count": 1
             }
-            for session in sessions
-        ]
+        ).sort("updated_at", -1)
+        
+        return [session async for session in cursor]
     
     @with_database_retry(operation_name="get_session_history")
     async def get_session_history(self, session_id: str) -> List[dict]:
         """Get message history for a session
         
+        Served from an in-process LRU cache while the session's updated_at is unchanged.
+        The returned list may be shared with the cache and must not be mutated.
+        
+        Long conversations are summarized as they grow, so this returns only the messages
+        that haven't been folded into the summary: it can be shorter than message_count.
+        
         Args:
             session_id: The ID of the session
             
         Returns:
             List of message dictionaries
         """
+        # updated_at moves on every chat turn, so it doubles as a freshness token (one indexed lookup)
+        metadata = await ChatSessionMetadata.get_motor_collection().find_one(
+            {"session_id": session_id},
+            projection={"_id": 0, "updated_at": 1}
+        )
+        updated_at = metadata["updated_at"] if metadata else None
+        
+        if updated_at is not None:
+            cached = self._history_cache.get(session_id)
+            if cached is not None and cached[0] == updated_at:
+                return cached[1]
+        
+        messages = await self._load_session_history(session_id)
+        
+        # Only cache sessions with tracked metadata; empty results may be a swallowed error
+        if updated_at is not None and messages:
+            self._history_cache.set(session_id, (updated_at, messages))
+        return messages
+    
+    async def _load_session_history(self, session_id: str) -> List[dict]:
+        """Read the message history for a session from the checkpoint store"""
         # Ensure AsyncMongoDBSaver is initialized in async context
-        if not hasattr(self, "_memory_initialized") or not self._memory_initialized:
-            logger.info(f"Initializing AsyncMongoDBSaver before retrieving session history for {session_id}")
-            await self.initialize_async_memory()
+        await self._ensure_memory()
             
         # Configure thread_id for persistent memory
         config = {"configurable": {"thread_id": session_id}}
         
         try:
-            # Get the current state from memory
-            checkpoint = await self.graph.aget_state(config)
-            
-            # Debug logging to understand the checkpoint structure
-            logger.info(f"Checkpoint type: {type(checkpoint)}")
-            
             # For MongoDB persistence, we need to directly query the database
             # since the checkpoint structure might not expose messages properly
             try:
-                # Get the most recent chat history from the database directly
-                # LangGraph doesn't expose collection_name as an attribute
-                # Let's check what collections actually exist in the database
-                db = self.memory.client[self.memory.db_name]
-                collections = await db.list_collection_names()
-                logger.debug(f"Available collections in database: {collections}")
-                
-                # Based on LangGraph implementation, we know it uses specific collection names
-                collection = db['checkpoints_aio']
-                
                 # Query for the latest checkpoint with this session_id (LangGraph thread_id)
-                result = await collection.find_one(
-                    {"thread_id": session_id},  # LangGraph uses thread_id as the persistence key
-                    sort=[("timestamp", -1)]  # Get the most recent one
+                # Checkpoint ids are time-ordered, so the highest id is the most recent one
+                # Only the serialized checkpoint is needed, skip metadata and parent ids
+                result = await self._checkpoints_coll.find_one(
+                    {"thread_id": session_id, "checkpoint_ns": ""},
+                    projection={"type": 1, "checkpoint": 1, "_id": 0},
+                    sort=[("checkpoint_id", -1)]
                 )
                 
-                if result and "state" in result and "values" in result["state"]:
-                    state_values = result["state"]["values"]
+                if result:
+                    # The saver stores the checkpoint as a serialized blob, decode it with its own serializer
+                    checkpoint_data = self.memory.serde.loads_typed((result["type"], result["checkpoint"]))
+                    state_values = checkpoint_data.get("channel_values", {})
                     if "messages" in state_values:
                         messages_data = state_values["messages"]
-                        logger.info(f"Found {len(messages_data)} messages in MongoDB for session {session_id}")
-                        
-                        # Format messages for API response
-                        messages = []
-                        for msg in messages_data:
-                            # Handle different message formats
-                            if isinstance(msg, dict):
-                                role = msg.get("role", "unknown")
-                                content = msg.get("content", str(msg))
-                            else:
-                                role = msg.type if hasattr(msg, "type") else "unknown"
-                                content = msg.content if hasattr(msg, "content") else str(msg)
-                                
-                            messages.append({
-                                "role": role,
-                                "content": content
-                            })
+                        logger.info("Found %d messages in MongoDB for session %s", len(messages_data), session_id)
                         
-                        return messages
+                        return self._format_messages(messages_data)
             except Exception as db_err:
-                logger.error(f"Error querying MongoDB directly: {str(db_err)}")
-                logger.error(traceback.format_exc())
-            
-            # Fallback to using the checkpoint if direct DB query failed
-            if checkpoint and hasattr(checkpoint, 'values') and "messages" in checkpoint.values:
-                messages_data = checkpoint.values["messages"]
-                
-                # Format messages for API response
-                messages = []
-                for msg in messages_data:
-                    messages.append({
-                        "role": msg.type if hasattr(msg, "type") else "unknown",
-                        "content": msg.content if hasattr(msg, "content") else str(msg)
-                    })
+                logger.exception("Error querying MongoDB directly: %s", db_err)
                 
-                return messages
+                # Fallback to the graph state only if the direct DB query failed
+                checkpoint = await self.graph.aget_state(config)
+                if checkpoint and hasattr(checkpoint, 'values') and "messages" in checkpoint.values:
+                    return self._format_messages(checkpoint.values["messages"])
                 
-            logger.info(f"No messages found for session {session_id}")
+            logger.info("No messages found for session %s", session_id)
             return []
             
         except Exception as e:
-            logger.error(f"Error retrieving session history for {session_id}: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error retrieving session history for %s: %s", session_id, e)
             return []
     
-    @with_database_retry(operation_name="update_session_metadata")
-    async def update_session_metadata(self, session_id: str, increment_messages: int = 1):
-        """Update session metadata when a new message is sent
-        
-        Args:
-            session_id: The ID of the session
-            increment_messages: Number of messages to increment the count by
-        """
-        try:
-            # Find and update the session
-            session = await ChatSessionMetadata.find_one(ChatSessionMetadata.session_id == session_id)
-            if session:
-                session.updated_at = datetime.now()
-                session.message_count += increment_messages
-                
+    @staticmethod
+    def _format_messages(messages_data: list) -> List[dict]:
+        """Format stored messages (message objects or plain dicts) as role/content dicts for the API"""
+        if not messages_data:
+            return []
+        # A history is either all dicts or all message objects, so pick the path once
+        if isinstance(messages_data[0], dict):
+            return [
+                {"role": m.get("role", "unknown"), "content": m.get("content") or ""}
+                for m in messages_data
+            ]
+        return [
+            {"role": getattr(m, "type", "unknown"), "content": getattr(m, "content", None) or ""}
+            for m in messages_data
+        ]
 
-                await session.save()
-                logger.debug(f"Updated session metadata for {session_id}")
-            else:
-                logger.warning(f"Session {session_id} not found for metadata update")
-        except Exception as e:
-            logger.error(f"Error updating session metadata for {session_id}: {str(e)}")
-            logger.error(traceback.format_exc())
-    
     @with_database_retry(operation_name="update_session")
     async def update_session(self, username: str, session_id: str, name: str = None) -> dict:
         """Update a chat session's metadata
@@ -396,37 +428,34 @@ class ChatService:
             Updated session metadata dictionary
         """
         try:
-            # Find the session
-            session = await ChatSessionMetadata.find_one(ChatSessionMetadata.session_id == session_id)
-            if not session:
-                logger.warning(f"Session {session_id} not found for update")
-                raise ValueError(f"Session {session_id} not found")
-                
-            # Verify ownership
-            if session.username != username:
-                logger.warning(f"User {username} attempted to update session {session_id} owned by {session.username}")
-                raise ValueError(f"Session {session_id} does not belong to user {username}")
+            collection = ChatSessionMetadata.get_motor_collection()
             
-            # Update fields
+            # Update fields; matching on the owner too makes the ownership check part of the write
+            fields = {"updated_at": datetime.now(timezone.utc)}
             if name is not None:
-                session.name = name
-                
-            session.updated_at = datetime.now()
-            await session.save()
+                fields["name"] = name
+            session = await collection.find_one_and_update(
+                {"session_id": session_id, "username": username},
+                {"$set": fields},
+                projection={"session_id": 1, "name": 1, "created_at": 1, "updated_at": 1, "message_count": 1, "_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            
+            if session is None:
+                # Tell a missing session apart from one owned by another user
+                owner = await collection.find_one({"session_id": session_id}, projection={"username": 1})
+                if not owner:
+                    logger.warning(f"Session {session_id} not found for update")
+                    raise ValueError(f"Session {session_id} not found")
+                logger.warning(f"User {username} attempted to update session {session_id} owned by {owner['username']}")
+                raise ValueError(f"Session {session_id} does not belong to user {username}")
             
             logger.info(f"Updated session {session_id} for user {username}")
             
             # Return updated session data
-            return {
-                "session_id": session.session_id,
-                "name": session.name,
-                "created_at": session.created_at,
-                "updated_at": session.updated_at,
-                "message_count": session.message_count
-            }
+            return session
         except Exception as e:
-            logger.error(f"Error updating session {session_id}: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error updating session %s: %s", session_id, e)
             raise
     
     @with_database_retry(operation_name="generate_session_title")
@@ -439,6 +468,10 @@ class ChatService:
         Returns:
             A generated title string
         """
+        cached_title = self._title_cache.get(session_id)
+        if cached_title is not None:
+            return cached_title
+
         try:
             # Get the session messages
             messages = await self.get_session_history(session_id)
@@ -448,25 +481,25 @@ class ChatService:
                 logger.info(f"Not enough messages in session {session_id} to generate title")
                 return "New Chat"
             
-            # Extract the first few messages for context (limit to avoid token issues)
-            context_messages = messages[:min(3, len(messages))]
-            message_texts = [f"{msg['role']}: {msg['content']}" for msg in context_messages]
-            context = "\n".join(message_texts)
+            # The opening user message is what a conversation is about; skip the (longer) replies
+            context = next(
+                (msg["content"] for msg in messages if msg["role"] in ("human", "user")),
+                messages[0]["content"]
+            )
             
-            # Create a system prompt for title generation
-            system_prompt = "Based on this conversation, generate an ultra short, descriptive title, max 3 words. Respond with ONLY the title, no quotes or explanations."
+            # A short opening message is already a good title; no need for an LLM round-trip
+            if len(context.split()) <= 5 and len(context) <= 40:
+                title = context.strip().rstrip('.?!')
+                # Capitalize only the first letter; str.title() mangles words like "What's" and "GPT"
+                title = title[:1].upper() + title[1:]
+                if title:
+                    logger.info("Using opening message as title for session %s: %s", session_id, title)
+                    self._title_cache.set(session_id, title)
+                    return title
             
-            # Use the LLM to generate a title
-            title_messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": context}
-            ]
-            
-            # Use the same LLM instance but with different parameters for title generation
-            response = await self.llm.ainvoke(
-                title_messages,
-                temperature=0.7,
-                max_tokens=10  # Keep titles short
+            # Use the dedicated title LLM with the prebuilt system prompt
+            response = await self._title_llm.ainvoke(
+                [TITLE_SYSTEM_MESSAGE, HumanMessage(content=context)]
             )
             
             # Extract and clean the title
@@ -480,11 +513,11 @@ class ChatService:
                 return "Chat Session"
                 
             logger.info(f"Generated title for session {session_id}: {title}")
+            self._title_cache.set(session_id, title)
             return title
             
         except Exception as e:
-            logger.error(f"Error generating title for session {session_id}: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error generating title for session %s: %s", session_id, e)
             return "Chat Session"  # Fallback title
     
    
\ No newline at end of file
@@ -1,21 +1,231 @@
+import ast
 import logging
+import math
+import operator
+import re
+import threading
 import time
-from typing import Annotated, Optional
+from functools import lru_cache
+from typing import Annotated, Optional, Sequence
+
+import tiktoken
 from typing_extensions import TypedDict
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import (
+    AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage, message_chunk_to_message, trim_messages
+)
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 
+from app.services.llm_cache import LLMCache
+from app.services.lru_cache import LRUCache
+
 logger = logging.getLogger(__name__)
 
+# Once a conversation grows past MAX_HISTORY_MESSAGES, everything but the most recent
+# KEEP_RECENT_MESSAGES is folded into a running summary so checkpoints and prompts stay bounded
+MAX_HISTORY_MESSAGES = 30
+KEEP_RECENT_MESSAGES = 10
+
+# Token budget for the conversation sent with each general chat call; the oldest turns are dropped first
+MAX_PROMPT_TOKENS = 2048
+# Approximate per-message framing overhead in OpenAI chat formats
+_TOKENS_PER_MESSAGE = 4
+
+# Encodings that have loaded, by model name. Until a model's encoding is ready, token counts
+# are estimated from text length, so no chat turn ever waits for it.
+_ENCODINGS: dict[str, tiktoken.Encoding] = {}
+# Model name -> (monotonic time before which a failed load isn't retried, current backoff delay)
+_ENCODING_BACKOFF: dict[str, tuple[float, float]] = {}
+_ENCODING_LOADS_IN_FLIGHT: set[str] = set()
+_ENCODING_RETRY_MIN_SECONDS = 60
+_ENCODING_RETRY_MAX_SECONDS = 3600
+
+def _load_encoding(model_name: str) -> None:
+    """Load a model's encoding into _ENCODINGS, or back off before the next attempt. Runs in a worker thread."""
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads encoding files on first use, which fails without network access
+        delay = _ENCODING_BACKOFF.get(model_name, (0.0, _ENCODING_RETRY_MIN_SECONDS / 2))[1] * 2
+        delay = min(delay, _ENCODING_RETRY_MAX_SECONDS)
+        _ENCODING_BACKOFF[model_name] = (time.monotonic() + delay, delay)
+        logger.warning(
+            "Couldn't load the tiktoken encoding for model %r, estimating token counts (retry in %ds): %s",
+            model_name, delay, e
+        )
+    else:
+        _ENCODINGS[model_name] = encoding
+        _ENCODING_BACKOFF.pop(model_name, None)
+    finally:
+        _ENCODING_LOADS_IN_FLIGHT.discard(model_name)
+
+def warm_encoding(model_name: str) -> Optional[threading.Thread]:
+    """Start loading a model's tiktoken encoding in the background
+
+    Does nothing if it has loaded, is loading, or failed recently. Returns the loading thread, if one was started.
+    """
+    if model_name in _ENCODINGS or model_name in _ENCODING_LOADS_IN_FLIGHT:
+        return None
+    backoff = _ENCODING_BACKOFF.get(model_name)
+    if backoff is not None and time.monotonic() < backoff[0]:
+        return None
+    _ENCODING_LOADS_IN_FLIGHT.add(model_name)
+    # A daemon thread rather than the event loop's executor: tiktoken downloads without a timeout,
+    # and a hung download must not hold up shutdown
+    thread = threading.Thread(target=_load_encoding, args=(model_name,), name="tiktoken-load", daemon=True)
+    thread.start()
+    return thread
+
+def encoding_if_loaded(model_name: str) -> Optional[tiktoken.Encoding]:
+    """Return a model's tiktoken encoding if it is ready; otherwise start loading it and return None"""
+    encoding = _ENCODINGS.get(model_name)
+    if encoding is None:
+        warm_encoding(model_name)
+    return encoding
+
+def _message_text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+def _count_tokens(messages: Sequence[BaseMessage], encoding: Optional[tiktoken.Encoding]) -> int:
+    total = 0
+    for m in messages:
+        text = _message_text(m)
+        total += _TOKENS_PER_MESSAGE + (len(encoding.encode(text)) if encoding else len(text) // 4 + 1)
+    return total
+
+def _truncate_to_tokens(text: str, max_tokens: int, encoding: Optional[tiktoken.Encoding]) -> str:
+    """Return the end of text that fits in max_tokens"""
+    if encoding:
+        return encoding.decode(encoding.encode(text)[-max_tokens:])
+    # Without an encoding, keep what the len(text) // 4 + 1 estimate counts as max_tokens
+    return text[max(len(text) - (max_tokens - 1) * 4, 0):]
+
+# Summarization prompts, built once
+_SUMMARIZE_MESSAGE = HumanMessage(content="Summarize the conversation above.")
+_EXTEND_SUMMARY_TEMPLATE = (
+    "This is a summary of the conversation so far: {summary}\n\n"
+    "Extend the summary by taking into account the messages above."
+)
+_SUMMARY_PREFIX_TEMPLATE = "Summary of the earlier conversation: {summary}"
+
+# An arithmetic expression, optionally phrased as a question ("What is 5+7?"). Every message
+# is checked, so the patterns are kept free of overlapping repeats that could backtrack, and
+# the surrounding whitespace and punctuation are stripped with string methods instead
+_CALC_PREFIX_RE = re.compile(r"(?:what\s+is|what's|calculate|compute|evaluate)\s+", re.IGNORECASE)
+_EXPRESSION_RE = re.compile(r"[\d\s+\-*/().%^]+")
+_OPERATOR_RE = re.compile(r"\d\s*[+\-*/%^]|[+\-*/%^]\s*[\d(]")
+# Numbers joined twice by the same "/" or "-" are dates or phone numbers more often than sums
+_DATE_LIKE_RE = re.compile(r"\d+([/-])\d+\1\d+")
+_TRAILING_CHARS = "=?!. \t\r\n"
+# Longer messages are never treated as calculator requests
+_MAX_CALC_MESSAGE_LENGTH = 200
+
+def extract_expression(message: str) -> Optional[str]:
+    """Return the arithmetic expression in a calculator-style message, or None
+
+    Without a calculation prefix ("what is", "calculate", ...) or an "=", a message only counts
+    if it has at least two operators, so "24/7" or "9-5" go to the LLM. Anything that doesn't
+    parse as an expression ("100%", "(1+2") does too.
+    """
+    if len(message) > _MAX_CALC_MESSAGE_LENGTH:
+        return None
+    text = message.strip()
+    stripped = text.rstrip(_TRAILING_CHARS)
+    explicit = "=" in text[len(stripped):]
+    text = stripped
+    prefix = _CALC_PREFIX_RE.match(text)
+    if prefix:
+        text = text[prefix.end():]
+        explicit = True
+    elif text.startswith("="):
+        text = text[1:].lstrip()
+        explicit = True
+    if not (text and _EXPRESSION_RE.fullmatch(text) and _OPERATOR_RE.search(text)):
+        return None
+    try:
+        tree = ast.parse(text.replace("^", "**"), mode="eval")
+    except (SyntaxError, RecursionError):
+        return None
+    if not explicit:
+        operators = sum(isinstance(node, ast.BinOp) for node in ast.walk(tree))
+        if operators < 2 or _DATE_LIKE_RE.fullmatch(text):
+            return None
+    return text
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+# Evaluation runs on the event loop, so every intermediate integer is capped in size before
+# it is computed ("(9^999)^999" would otherwise mean hundreds of millions of digits)
+_MAX_RESULT_BITS = 10_000
+_MAX_EXPRESSION_LENGTH = 200
+
+def _check_result_size(op: ast.operator, left, right) -> None:
+    """Raise ValueError if applying op to left and right would produce an oversized integer"""
+    if isinstance(op, ast.Pow):
+        if right > 0 and abs(left) > 1 and right * math.log2(abs(left)) > _MAX_RESULT_BITS:
+            raise ValueError("Result too large")
+    elif isinstance(op, ast.Mult) and isinstance(left, int) and isinstance(right, int):
+        if left.bit_length() + right.bit_length() > _MAX_RESULT_BITS:
+            raise ValueError("Result too large")
+
+def _evaluate_node(node: ast.AST):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        left, right = _evaluate_node(node.left), _evaluate_node(node.right)
+        _check_result_size(node.op, left, right)
+        return _BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_evaluate_node(node.operand))
+    raise ValueError(f"Unsupported expression element: {type(node).__name__}")
+
+def evaluate_expression(expression: str) -> str:
+    """Safely evaluate an arithmetic expression; only numbers and arithmetic operators are allowed
+
+    "^" is treated as exponentiation, as users mean it.
+    """
+    if len(expression) > _MAX_EXPRESSION_LENGTH:
+        raise ValueError("Expression too long")
+    tree = ast.parse(expression.replace("^", "**"), mode="eval")
+    return str(_evaluate_node(tree.body))
+
+@lru_cache(maxsize=1024)
+def calculator_reply(expression: str) -> str:
+    """Return the assistant's reply text for an expression, cached per expression
+
+    Only the text is cached: add_messages assigns ids to the message objects it receives,
+    so every reply needs a fresh AIMessage.
+    """
+    return f"The result is: {evaluate_expression(expression)}"
+
+# Nodes whose message output is the assistant's reply to the user
+REPLY_NODES = frozenset({"calculator_handler", "generate_response"})
+
 class EnhancedState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
     intent: Optional[str] = None
-    calculation_result: Optional[str] = None
+    summary: Optional[str] = None
+    # Running total of messages folded into the summary and removed from messages
+    summarized_messages: Annotated[int, operator.add]
+
+# (id(llm), id(checkpointer)) -> (llm, checkpointer, compiled graph). Entries hold references to
+# their llm and checkpointer so those ids can't be reused by other objects while cached.
+_GRAPH_CACHE = LRUCache(maxsize=8)
 
 def build_chat_graph(llm, checkpointer):
     """
-    Build and return the LangGraph workflow for chat processing.
+    Return the LangGraph workflow for chat processing, compiling it once per (llm, checkpointer).
 
     Args:
         llm: The language model instance to use in the nodes.
@@ -24,87 +234,132 @@ def build_chat_graph(llm, checkpointer):
     Returns:
         Compiled StateGraph instance.
     """
-    async def identify_intent(state: EnhancedState) -> EnhancedState:
+    key = (id(llm), id(checkpointer))
+    cached = _GRAPH_CACHE.get(key)
+    if cached is None:
+        cached = (llm, checkpointer, _compile_chat_graph(llm, checkpointer))
+        _GRAPH_CACHE.set(key, cached)
+    return cached[2]
+
+def _compile_chat_graph(llm, checkpointer):
+    """Build and compile the chat StateGraph around the given llm and checkpointer"""
+    # Replies are only reproducible, and so only cacheable, when sampling is deterministic
+    response_cache = LLMCache() if getattr(llm, "temperature", None) == 0 else None
+    model_name = getattr(llm, "model_name", "")
+
+    def general_prompt(state: EnhancedState, encoding: Optional[tiktoken.Encoding]) -> list:
+        # Keep the most recent messages that fit the token budget, starting on a user turn
+        messages = trim_messages(
+            state["messages"],
+            max_tokens=MAX_PROMPT_TOKENS,
+            token_counter=lambda msgs: _count_tokens(msgs, encoding),
+            strategy="last",
+            start_on="human",
+            include_system=True,
+        )
+        if not any(isinstance(m, HumanMessage) for m in messages):
+            # The latest user message alone is over the budget; send the end of it rather than no question
+            latest = next((m for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), None)
+            if latest is not None:
+                messages = [m for m in messages if isinstance(m, SystemMessage)]
+                budget = max(MAX_PROMPT_TOKENS - _count_tokens(messages, encoding) - _TOKENS_PER_MESSAGE, 1)
+                content = _truncate_to_tokens(_message_text(latest), budget, encoding)
+                messages.append(HumanMessage(content=content, id=latest.id))
+        summary = state.get("summary")
+        if summary:
+            return [SystemMessage(content=_SUMMARY_PREFIX_TEMPLATE.format(summary=summary))] + messages
+        return messages
+
+    def route_history(state: EnhancedState) -> str:
+        return "summarize_history" if len(state["messages"]) > MAX_HISTORY_MESSAGES else "identify_intent"
+
+    async def summarize_history(state: EnhancedState) -> dict:
+        old_messages = state["messages"][:-KEEP_RECENT_MESSAGES]
+        previous_summary = state.get("summary")
+        if previous_summary:
+            instruction = HumanMessage(content=_EXTEND_SUMMARY_TEMPLATE.format(summary=previous_summary))
+        else:
+            instruction = _SUMMARIZE_MESSAGE
+        try:
+            response = await llm.ainvoke(old_messages + [instruction])
+        except Exception as e:
+            # Keep the full history for this turn; summarization is retried on the next one
+            logger.error("Error summarizing conversation history: %s", e)
+            return {}
+        logger.info("Summarized %d older messages", len(old_messages))
+        return {
+            "summary": response.content,
+            "messages": [RemoveMessage(id=msg.id) for msg in old_messages],
+            "summarized_messages": len(old_messages),
+        }
+
+    async def identify_intent(state: EnhancedState) -> dict:
         latest_message = state["messages"][-1].content if state["messages"] else ""
         if not latest_message:
             logger.warning("Empty message received for intent classification")
-            state["intent"] = "other"
-            return state
-        intent_categories = ["calculator", "other"]
-        system_prompt = """You are an intent classification system. 
-        Classify the user message into exactly one of the following categories:
-        - calculator: Mathematical expressions or requests for calculations
-        - other: Any other type of message
-        
-        Respond with ONLY the category name, nothing else."""
-        try:
-            classification_response = await llm.ainvoke(
-                [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": latest_message}
-                ],
-                temperature=0.1,
-                max_tokens=10
-            )
-            intent = classification_response.content.strip().lower()
-            if intent in intent_categories:
-                logger.info(f"AI identified intent: {intent} for message: {latest_message[:50]}...")
-                state["intent"] = intent
-            else:
-                logger.warning(f"AI returned unknown intent: {intent}, defaulting to 'other'")
-                state["intent"] = "other"
-        except Exception as e:
-            logger.error(f"Error in intent classification: {str(e)}")
-            state["intent"] = "other"
-        return state
+            return {"intent": "other"}
+        # Classified locally: a calculator request is just an arithmetic expression
+        intent = "calculator" if extract_expression(latest_message) else "other"
+        logger.debug("Identified intent %s for message: %.50s", intent, latest_message)
+        return {"intent": intent}
 
-    async def calculator_handler(state: EnhancedState) -> EnhancedState:
+    async def calculator_handler(state: EnhancedState) -> dict:
+        # The reply is computed locally, so this node answers directly and the graph ends here
         latest_message = state["messages"][-1].content
         try:
-            result = str(eval(latest_message))
-            state["calculation_result"] = result
-            logger.info(f"Calculator result: {result} for expression: {latest_message}")
+            reply = calculator_reply(extract_expression(latest_message))
+            logger.info("Calculator reply: %s for expression: %s", reply, latest_message)
         except Exception as e:
-            logger.error(f"Error evaluating calculator expression: {str(e)}")
-            state["calculation_result"] = f"Error: Could not calculate '{latest_message}'"
-        return state
-
-    async def general_chat_handler(state: EnhancedState) -> EnhancedState:
-        logger.info("Processing general chat message")
-        return state
-
-    async def generate_response(state: EnhancedState) -> EnhancedState:
-        intent = state.get("intent", "other")
-        if intent == "calculator" and "calculation_result" in state:
-            result = state["calculation_result"]
-            response_content = f"The result is: {result}"
-            response = {"role": "assistant", "content": response_content}
-            logger.info(f"Generated calculator response: {response_content}")
+            logger.error("Error evaluating calculator expression: %s", e)
+            reply = f"The result is: Error: Could not calculate '{latest_message}'"
+        return {"messages": [AIMessage(content=reply)]}
+
+    async def generate_response(state: EnhancedState) -> dict:
+        # Only read the clock when the timing line will actually be logged
+        log_timing = logger.isEnabledFor(logging.INFO)
+        start_ns = time.monotonic_ns() if log_timing else 0
+        logger.debug("Starting LLM invocation for general chat")
+        try:
+            prompt = general_prompt(state, encoding_if_loaded(model_name))
+            cache_key = None
+            if response_cache is not None:
+                cache_key = LLMCache.make_key(model_name, 0, prompt)
+                cached_content = response_cache.get(cache_key)
+                if cached_content is not None:
+                    logger.debug("LLM response cache hit")
+                    return {"messages": [AIMessage(content=cached_content)]}
+            # Stream the reply so graph.astream(stream_mode="messages") callers get tokens as they arrive;
+            # the aggregated message is what gets checkpointed
+            chunks = None
+            async for chunk in llm.astream(prompt):
+                chunks = chunk if chunks is None else chunks + chunk
+            if chunks is None:
+                # Nothing to aggregate; checkpoint an empty reply instead of failing the turn, and don't cache it
+                logger.warning("LLM returned an empty stream")
+                return {"messages": [AIMessage(content="")]}
+            response = message_chunk_to_message(chunks)
+            if cache_key is not None:
+                response_cache.set(cache_key, response.content)
+            if log_timing:
+                elapsed_ms = (time.monotonic_ns() - start_ns) // 1_000_000
+                logger.info("LLM responded in %dms: %.100s...", elapsed_ms, response.content)
             return {"messages": [response]}
-        else:
-            start_time = time.time()
-            logger.debug("Starting LLM invocation for general chat")
-            try:
-                response = await llm.ainvoke(state["messages"])
-                elapsed = time.time() - start_time
-                logger.info(f"LLM responded in {elapsed:.2f}s: {response.content[:100]}...")
-                return {"messages": [response]}
-            except Exception as e:
-                logger.error(f"LLM error: {str(e)}")
-                raise
+        except Exception as e:
+            logger.error("LLM error: %s", e)
+            raise
 
     # Build the graph
     graph_builder = StateGraph(EnhancedState)
+    graph_builder.add_node("summarize_history", summarize_history)
     graph_builder.add_node("identify_intent", identify_intent)
     graph_builder.add_node("calculator_handler", calculator_handler)
-    graph_builder.add_node("general_chat_handler", general_chat_handler)
     graph_builder.add_node("generate_response", generate_response)
-    graph_builder.add_edge(START, "identify_intent")
+    graph_builder.add_conditional_edges(START, route_history)
+    graph_builder.add_edge("summarize_history", "identify_intent")
     graph_builder.add_conditional_edges(
         "identify_intent",
-        lambda x: "calculator_handler" if x["intent"] == "calculator" else "general_chat_handler"
+        lambda x: "calculator_handler" if x["intent"] == "calculator" else "generate_response"
     )
-    graph_builder.add_edge("calculator_handler", "generate_response")
-    graph_builder.add_edge("general_chat_handler", "generate_response")
+    graph_builder.add_edge("calculator_handler", END)
     graph_builder.add_edge("generate_response", END)
     return graph_builder.compile(checkpointer=checkpointer)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Response cache for deterministic LLM calls
+"""
+import hashlib
+import json
+import time
+from typing import Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+
+from app.services.lru_cache import LRUCache
+
+
+class LLMCache:
+    """In-process cache of LLM reply contents keyed by (model, temperature, messages)
+
+    Only meaningful for deterministic calls (temperature 0); callers are expected to gate on that.
+    Not thread-safe; meant to be used from the event loop thread only.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: Optional[float] = 3600):
+        self.ttl_seconds = ttl_seconds
+        self._entries = LRUCache(maxsize=maxsize)
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: Sequence[BaseMessage]) -> str:
+        """Hash the parts of a request that determine its reply"""
+        payload = {
+            "model": model,
+            "temperature": temperature,
+            "messages": [(m.type, m.content) for m in messages],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached reply content, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, content = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self._entries.pop(key)
+            return None
+        return content
+
+    def set(self, key: str, content: str) -> None:
+        """Cache a reply content for the configured TTL"""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+        self._entries.set(key, (expires_at, content))
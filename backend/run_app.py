@@ -2,6 +2,7 @@
 """
 Run the FastAPI application for testing
 """
+import os
 import uvicorn
 import sys
 import logging
@@ -22,7 +23,7 @@ if __name__ == "__main__":
         
         # Log the setup before running
         logger.info("Running uvicorn server")
-        uvicorn.run("app.application:app", host="127.0.0.1", port=8000, reload=False, log_level="error")
+        uvicorn.run("app.application:app", host="127.0.0.1", port=int(os.getenv("PORT", "8000")), reload=False, log_level="error")
     except Exception as e:
         error_detail = f"Error starting server: {str(e)}\n{traceback.format_exc()}"
         logger.error(error_detail)
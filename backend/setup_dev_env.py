@@ -18,7 +18,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "."))
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join("app", ".env"))
 
-async def setup_dev_environment():
+async def setup_dev_environment(client: httpx.AsyncClient):
     """Setup the development environment"""
     print("Setting up development environment...")
     
@@ -27,21 +27,20 @@ async def setup_dev_environment():
     setup_endpoint = f"{api_url}/api/v1/auth/setup-dev-user"
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(setup_endpoint)
-            response.raise_for_status()
-            result = response.json()
-            
-            print("\n=== Development User Setup ===")
-            print(f"Status: {result['message']}")
-            print(f"User ID: {result['user_id']}")
-            print(f"Email: {result['email']}")
-            print("Password: devpassword123")
-            
-            print("\nYou can now use these credentials for development.")
-            print("To use them in the frontend, add the following to your .env.local file:")
-            print("\nVITE_SUPABASE_DEV_EMAIL=dev@example.com")
-            print("VITE_SUPABASE_DEV_PASSWORD=devpassword123")
+        response = await client.post(setup_endpoint)
+        response.raise_for_status()
+        result = response.json()
+        
+        print("\n=== Development User Setup ===")
+        print(f"Status: {result['message']}")
+        print(f"User ID: {result['user_id']}")
+        print(f"Email: {result['email']}")
+        print("Password: devpassword123")
+        
+        print("\nYou can now use these credentials for development.")
+        print("To use them in the frontend, add the following to your .env.local file:")
+        print("\nVITE_SUPABASE_DEV_EMAIL=dev@example.com")
+        print("VITE_SUPABASE_DEV_PASSWORD=devpassword123")
     except Exception as e:
         print(f"\nError setting up development environment: {str(e)}")
         print("\nMake sure the backend server is running and environment variables are set.")
@@ -51,5 +50,10 @@ async def setup_dev_environment():
         print("  - SUPABASE_SERVICE_KEY")
         sys.exit(1)
 
+async def main():
+    """Run the setup with an HTTP client that is closed afterwards"""
+    async with httpx.AsyncClient() as client:
+        await setup_dev_environment(client)
+
 if __name__ == "__main__":
-    asyncio.run(setup_dev_environment())
+    asyncio.run(main())
@@ -1,13 +1,51 @@
 """Central pytest configuration for all tests"""
+import asyncio
+import contextlib
+import logging
 import os
+import signal
+import socket
+import subprocess
 import sys
+import time
+from functools import lru_cache
+import httpx
+import pytest
 import pytest_asyncio
+from dotenv import load_dotenv
+
+try:
+    import uvloop
+except ImportError:  # e.g. on Windows, which uvloop doesn't support
+    uvloop = None
 
 # Add the parent directory to the path so we can import app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Under pytest-xdist, give each worker its own database so parallel runs don't share collections.
+# This must happen before app modules read MONGODB_DATABASE; app servers started by tests inherit it.
+_xdist_worker = os.environ.get("PYTEST_XDIST_WORKER")
+if _xdist_worker:
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', 'app', '.env'))
+    if os.environ.get("MONGODB_DATABASE"):
+        os.environ["MONGODB_DATABASE"] = f"{os.environ['MONGODB_DATABASE']}_{_xdist_worker}"
+
+# Keep a few MongoDB connections open for the whole run (see shared_db's warm-up)
+os.environ.setdefault("MONGODB_MIN_POOL_SIZE", "5")
+
 from app.models.user import User
+from app.models.chat_session import ChatSessionMetadata
 from app.database.mongodb import init_db, close_db_connection
+from app.auth.security import create_dev_token
+
+logger = logging.getLogger(__name__)
+
+# Tests log their progress at DEBUG; it's only shown when asked for, e.g. --log-cli-level=DEBUG.
+# Warnings and errors appear in pytest's captured-log section of a failed test's report.
+logging.getLogger().setLevel(logging.WARNING)
+
+# httpx logs every request at INFO; tests make many, so only let warnings through
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # NOTE: pytest-asyncio configuration is now in pytest.ini
 # This ensures the settings are loaded at the very beginning of pytest's execution
@@ -15,7 +53,12 @@ from app.database.mongodb import init_db, close_db_connection
 # - asyncio_mode = strict
 # - asyncio_default_fixture_loop_scope = session
 
-@pytest_asyncio.fixture(scope="session")
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    """Run all async tests on uvloop, the same event loop the app server uses, when it's installed"""
+    return uvloop.EventLoopPolicy() if uvloop else asyncio.DefaultEventLoopPolicy()
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
 async def shared_db():
     """Initialize the database once for all tests using the session event loop
     
@@ -25,11 +68,133 @@ async def shared_db():
     # The current event loop is already set by pytest-asyncio
     
     try:
-        print("\nInitializing shared database connection...")
-        await init_db([User])
-        print("✅ Database initialized successfully for all tests via shared fixture")
+        logger.debug("Initializing shared database connection")
+        # Register every document model the app's lifespan would, since in-process tests don't run it
+        await init_db([User, ChatSessionMetadata])
+        # Open several pooled connections up front so the first test doesn't pay for them
+        await asyncio.gather(*(User.find().limit(1).to_list() for _ in range(5)))
+        logger.debug("Database initialized for all tests via shared fixture")
 
         yield
     finally:
-        print("\nClosing shared database connection...")
+        logger.debug("Closing shared database connection")
         await close_db_connection()
+
+
+@pytest.fixture(scope="session")
+def app_server():
+    """Run the FastAPI app (run_app.py) in one separate process for the whole session
+    
+    For tests that need a real server over TCP. It listens on a free ephemeral port, so
+    workers under pytest-xdist don't collide and /health can't be answered by another
+    server; /health is polled with exponential backoff until it answers. The server logs at WARNING and its output is discarded; set
+    TEST_LOG_LEVEL (e.g. DEBUG) to change the level and TEST_CAPTURE_LOGS=1 to write the
+    output to a log file under backend/logs.
+    
+    Yields:
+        The base URL of the running server
+    """
+    logger.debug("Starting the FastAPI server...")
+    run_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'run_app.py'))
+    # Ask the OS for a free port; the server binds it again right after
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    
+    env = os.environ.copy()
+    env['PORT'] = str(port)
+    env['LOG_LEVEL'] = os.environ.get('TEST_LOG_LEVEL', 'WARNING')
+    
+    with contextlib.ExitStack() as stack:
+        if os.environ.get('TEST_CAPTURE_LOGS'):
+            # Create a log file to capture server output
+            log_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs'))
+            os.makedirs(log_dir, exist_ok=True)
+            log_file = os.path.join(log_dir, f"server_test_{int(time.time())}.log")
+            output = stack.enter_context(open(log_file, 'w'))
+            logger.debug("Server logs will be written to: %s", log_file)
+        else:
+            output = subprocess.DEVNULL
+        
+        # On POSIX, its own process group, so teardown also stops anything the server spawned
+        server = subprocess.Popen(
+            [sys.executable, run_app_path],
+            stdout=output,
+            stderr=output,
+            env=env,
+            start_new_session=os.name == "posix"
+        )
+        
+        try:
+            deadline = time.monotonic() + 10
+            delay = 0.05
+            while True:
+                try:
+                    if httpx.get(f"{base_url}/health", timeout=0.25).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("server failed to start")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+            
+            yield base_url
+        finally:
+            logger.debug("Shutting down the FastAPI server...")
+            if server.poll() is None:
+                if os.name == "posix":
+                    os.killpg(server.pid, signal.SIGTERM)
+                else:
+                    server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+            logger.debug("Server process exited with code %s", server.returncode)
+
+
+@pytest_asyncio.fixture(scope="session")
+async def http_client(shared_db):
+    """One HTTP client for the whole session that calls the FastAPI app in-process
+    
+    Requests go through httpx's ASGI transport on the test event loop, with no server or
+    socket involved. Paths are relative to the app root, e.g. http_client.get("/health").
+    The transport doesn't run the app's lifespan; shared_db does the database setup instead.
+    """
+    from app.application import app
+    from app.api.routes import chat_service
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        yield client
+    # Normally done by the app's lifespan on shutdown
+    await chat_service.aclose()
+
+
+@pytest_asyncio.fixture(scope="session")
+async def server_ready(http_client):
+    """Check once per session that the app reports healthy"""
+    response = await http_client.get("/health")
+    assert response.status_code == 200, f"Health check failed with status code: {response.status_code}"
+
+
+@lru_cache(maxsize=None)
+def _dev_headers(username: str = "dev_test_user") -> dict:
+    # Dev tokens don't expire and depend only on the username, so one set of headers per user
+    # serves the whole session. Callers share the dict and must not modify it.
+    return {
+        "Authorization": f"Bearer {create_dev_token(username=username)}",
+        "Content-Type": "application/json"
+    }
+
+
+@pytest.fixture(scope="session")
+def headers_for():
+    """Return a function that gives the (shared, read-only) request headers for a dev user
+    
+    When a dev token is used, the API creates the user in the database if it doesn't exist.
+    """
+    return _dev_headers
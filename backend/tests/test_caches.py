@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the in-process caches (no database or LLM needed)
+"""
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+import pytest_asyncio
+
+# Add the parent directory to the path so we can import app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.services import llm_cache
+from app.services.chat_service import ChatService
+from app.services.llm_cache import LLMCache
+from app.services.lru_cache import LRUCache
+
+
+class TestLRUCache:
+    """Tests for the bounded LRU mapping"""
+
+    def test_evicts_least_recently_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+
+        assert len(cache) == 2
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        assert cache.get("c") == 3
+
+    def test_get_refreshes_recency(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_set_existing_key_refreshes_recency(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("a", 10)
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 10
+
+    def test_missing_keys(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+
+        assert cache.get("missing") is None
+        assert cache.get("missing", "default") == "default"
+        assert cache.pop("missing") is None
+        assert cache.pop("missing", "default") == "default"
+        assert cache.pop("a") == 1
+        assert len(cache) == 0
+
+    def test_clear(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.clear()
+
+        assert len(cache) == 0
+        assert cache.get("a") is None
+
+
+class TestLLMCache:
+    """Tests for the deterministic LLM response cache"""
+
+    def test_entries_expire_after_ttl(self):
+        cache = LLMCache(ttl_seconds=10)
+        with patch.object(llm_cache.time, "monotonic", return_value=100.0):
+            cache.set("key", "reply")
+        with patch.object(llm_cache.time, "monotonic", return_value=110.0):
+            assert cache.get("key") == "reply"
+        with patch.object(llm_cache.time, "monotonic", return_value=110.5):
+            assert cache.get("key") is None
+        # Expired entries are dropped, not just hidden
+        assert len(cache._entries) == 0
+
+    def test_no_ttl_never_expires(self):
+        cache = LLMCache(ttl_seconds=None)
+        with patch.object(llm_cache.time, "monotonic", return_value=100.0):
+            cache.set("key", "reply")
+        with patch.object(llm_cache.time, "monotonic", return_value=1e12):
+            assert cache.get("key") == "reply"
+
+    def test_maxsize_bounds_entries(self):
+        cache = LLMCache(maxsize=1)
+        cache.set("a", "first")
+        cache.set("b", "second")
+
+        assert cache.get("a") is None
+        assert cache.get("b") == "second"
+
+    def test_key_is_stable_for_equal_requests(self):
+        messages = [SystemMessage(content="Be brief"), HumanMessage(content="Hi")]
+        # Message ids and metadata don't change the reply, so they don't change the key
+        same_messages = [
+            SystemMessage(content="Be brief", id="1"),
+            HumanMessage(content="Hi", id="2", additional_kwargs={"source": "web"}),
+        ]
+
+        assert LLMCache.make_key("gpt", 0, messages) == LLMCache.make_key("gpt", 0, same_messages)
+
+    @pytest.mark.parametrize("model,temperature,messages", [
+        ("other-model", 0, [HumanMessage(content="Hi")]),
+        ("gpt", 0.5, [HumanMessage(content="Hi")]),
+        ("gpt", 0, [AIMessage(content="Hi")]),
+        ("gpt", 0, [SystemMessage(content="Hi")]),
+        ("gpt", 0, [HumanMessage(content="Hi"), HumanMessage(content="")]),
+        ("gpt", 0, [HumanMessage(content="Hi!")]),
+    ])
+    def test_key_depends_on_model_temperature_and_messages(self, model, temperature, messages):
+        assert LLMCache.make_key(model, temperature, messages) != LLMCache.make_key("gpt", 0, [HumanMessage(content="Hi")])
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def chat_service():
+    """A ChatService with no memory initialized, for exercising its caches"""
+    service = ChatService()
+    yield service
+    await service.aclose()
+
+
+class TestSessionHistoryCache:
+    """Tests for the get_session_history cache keyed on the session's updated_at"""
+
+    @staticmethod
+    def _patch_metadata(updated_at):
+        collection = MagicMock()
+        collection.find_one = AsyncMock(return_value={"updated_at": updated_at} if updated_at else None)
+        return patch(
+            "app.services.chat_service.ChatSessionMetadata.get_motor_collection", return_value=collection
+        )
+
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_served_from_cache_while_updated_at_is_unchanged(self, chat_service):
+        updated_at = datetime.now(timezone.utc)
+        history = [{"role": "user", "content": "Hi"}]
+        chat_service._load_session_history = AsyncMock(return_value=history)
+
+        with self._patch_metadata(updated_at):
+            assert await chat_service.get_session_history("s1") == history
+            assert await chat_service.get_session_history("s1") == history
+        assert chat_service._load_session_history.await_count == 1
+
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_reloaded_when_updated_at_moves(self, chat_service):
+        updated_at = datetime.now(timezone.utc)
+        first = [{"role": "user", "content": "Hi"}]
+        second = first + [{"role": "assistant", "content": "Hello"}]
+        chat_service._load_session_history = AsyncMock(side_effect=[first, second])
+
+        with self._patch_metadata(updated_at):
+            assert await chat_service.get_session_history("s1") == first
+        with self._patch_metadata(updated_at + timedelta(seconds=1)):
+            assert await chat_service.get_session_history("s1") == second
+        assert chat_service._load_session_history.await_count == 2
+
+    @pytest.mark.asyncio(loop_scope="session")
+    @pytest.mark.parametrize("updated_at,history", [
+        (None, [{"role": "user", "content": "Hi"}]),
+        (datetime(2025, 1, 1, tzinfo=timezone.utc), []),
+    ])
+    async def test_untracked_or_empty_histories_not_cached(self, chat_service, updated_at, history):
+        chat_service._load_session_history = AsyncMock(return_value=history)
+
+        with self._patch_metadata(updated_at):
+            await chat_service.get_session_history("s1")
+            await chat_service.get_session_history("s1")
+        assert chat_service._load_session_history.await_count == 2
+        assert len(chat_service._history_cache) == 0
+
+
+if __name__ == "__main__":
+    # When run directly as a script, run the tests with pytest
+    sys.exit(pytest.main(["-xvs", __file__]))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for streamed chat replies failing partway (no database or LLM needed)
+"""
+import sys
+import os
+from unittest.mock import AsyncMock, patch
+import httpx
+import orjson
+import pytest
+import pytest_asyncio
+
+# Add the parent directory to the path so we can import app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.api import routes
+from app.application import app
+from app.auth.models import AuthUser
+from app.auth.security import get_current_user
+from app.config import settings
+from app.services import chat_workflow
+from app.services.chat_service import ChatService
+from app.services.chat_workflow import build_chat_graph
+
+
+class _FailingLLM(BaseChatModel):
+    """Chat model that streams part of a reply, then fails
+
+    A real BaseChatModel, so its tokens reach graph.astream(stream_mode="messages") through callbacks.
+    """
+    model_name: str = "test-model"
+    temperature: float = 0.7
+
+    @property
+    def _llm_type(self) -> str:
+        return "failing-test-model"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for token in ("Partial ", "reply"):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        raise ConnectionError("connection reset")
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def failing_chat_service(monkeypatch):
+    """A ChatService whose graph runs on an in-memory saver and an LLM that fails mid-stream"""
+    monkeypatch.setattr(chat_workflow, "encoding_if_loaded", lambda model_name: None)
+    service = ChatService()
+    service._ensure_memory = AsyncMock()
+    service.graph = build_chat_graph(_FailingLLM(), MemorySaver())
+    yield service
+    await service.aclose()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_stream_chat_response_raises_after_partial_reply(failing_chat_service):
+    pieces = []
+    with pytest.raises(ConnectionError):
+        async for content in failing_chat_service.stream_chat_response("Hello", "stream_test_session"):
+            pieces.append(content)
+
+    assert "".join(pieces) == "Partial reply"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_chat_stream_sends_error_event_instead_of_done(failing_chat_service):
+    user = AuthUser(id="1", email="stream_test@example.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        with patch.object(routes, "chat_service", failing_chat_service):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                response = await client.post(
+                    f"{settings.API_PREFIX}/chat/stream",
+                    json={"message": "Hello", "session_id": f"{user.email}_stream"},
+                )
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert response.status_code == 200
+    events = [orjson.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[:-1] == [{"content": "Partial "}, {"content": "reply"}]
+    assert set(events[-1]) == {"error"}
+    assert not any("done" in event for event in events)
+
+
+if __name__ == "__main__":
+    # When run directly as a script, run the tests with pytest
+    sys.exit(pytest.main(["-xvs", __file__]))
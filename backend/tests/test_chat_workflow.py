@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the chat workflow's local helpers (no database or LLM needed)
+"""
+import sys
+import os
+import time
+import pytest
+
+# Add the parent directory to the path so we can import app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.services import chat_workflow
+from app.services.chat_checkpointer import conversation_message_count
+from app.services.chat_workflow import (
+    KEEP_RECENT_MESSAGES, MAX_HISTORY_MESSAGES, MAX_PROMPT_TOKENS, build_chat_graph, evaluate_expression,
+    extract_expression
+)
+
+
+class TestEvaluateExpression:
+    """Tests for the calculator's arithmetic evaluator"""
+
+    @pytest.mark.parametrize("expression,expected", [
+        ("5+7", "12"),
+        ("(2 + 3) * 4", "20"),
+        ("10 / 4", "2.5"),
+        ("7 // 2", "3"),
+        ("7 % 3", "1"),
+        ("2^10", "1024"),
+        ("-3 + +1", "-2"),
+        ("1.5 * 2", "3.0"),
+    ])
+    def test_arithmetic(self, expression, expected):
+        assert evaluate_expression(expression) == expected
+
+    def test_division_by_zero(self):
+        with pytest.raises(ZeroDivisionError):
+            evaluate_expression("1 / 0")
+
+    @pytest.mark.parametrize("expression", [
+        "__import__('os').system('true')",
+        "abs(-1)",
+        "x + 1",
+        "(1).real",
+        "[1, 2]",
+        "'a' * 3",
+    ])
+    def test_names_and_calls_rejected(self, expression):
+        with pytest.raises(ValueError):
+            evaluate_expression(expression)
+
+    @pytest.mark.parametrize("expression", [
+        "9^9^9",
+        "(9^999)^999",
+        "(9^999)^999*(9^999)^999*(9^999)^999",
+        "2^9000 * 2^9000",
+        "10^5000",
+    ])
+    def test_oversized_results_rejected(self, expression):
+        with pytest.raises(ValueError):
+            evaluate_expression(expression)
+
+    def test_long_expression_rejected(self):
+        with pytest.raises(ValueError):
+            evaluate_expression("1+" * 150 + "1")
+
+
+class TestExtractExpression:
+    """Tests for picking the expression out of a calculator-style message"""
+
+    @pytest.mark.parametrize("message,expected", [
+        ("5+7=", "5+7"),
+        ("= 5+7", "5+7"),
+        ("1+2*3", "1+2*3"),
+        ("What is 5+7?", "5+7"),
+        ("what's 2 ^ 10", "2 ^ 10"),
+        ("Calculate (2+3)*4 =", "(2+3)*4"),
+        ("  compute 10 / 4 !\n", "10 / 4"),
+        ("2.5*2*2.", "2.5*2*2"),
+        ("what is 10/12/2024", "10/12/2024"),
+    ])
+    def test_calculator_messages(self, message, expected):
+        assert extract_expression(message) == expected
+
+    @pytest.mark.parametrize("message", [
+        "",
+        "Hello there",
+        "2023.",
+        "What is 42?",
+        "What is 5+7? thanks",
+        # Bare single operations and dates are usually not calculator requests
+        "5+7",
+        "24/7",
+        "9-5",
+        "555-1234",
+        "10/12/2024",
+        "2023-10-15",
+        # Anything that doesn't parse goes to the LLM instead of an error reply
+        "100%",
+        "5%",
+        "(1+2",
+        "what is 3 +",
+        "what is 2 ** * 3",
+        "5+7" + "\n" * 100 + "thanks",
+        "1+" * 150 + "1",
+    ])
+    def test_other_messages(self, message):
+        assert extract_expression(message) is None
+
+    @pytest.mark.parametrize("message", [
+        "1" + " " * 190 + "x",
+        "1" + " " * 4000 + "x",
+        "5+7" + "\n" * 4000 + "thanks",
+        "what is" + " " * 4000 + "5+7",
+    ])
+    def test_long_whitespace_runs_are_fast(self, message):
+        start = time.monotonic()
+        assert extract_expression(message) is None
+        assert time.monotonic() - start < 0.1
+
+
+class _RecordingLLM:
+    """Stands in for the chat model: records each prompt and streams a fixed reply"""
+    model_name = "test-model"
+    temperature = 0.7
+
+    def __init__(self):
+        self.prompts = []
+
+    async def astream(self, prompt):
+        self.prompts.append(prompt)
+        yield AIMessageChunk(content="ok")
+
+    async def ainvoke(self, prompt):
+        # Only used for summarization
+        return AIMessage(content="summary")
+
+
+class TestGeneralPrompt:
+    """Tests for the prompt sent with general chat turns"""
+
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_oversized_message_is_truncated_not_dropped(self, monkeypatch):
+        # Estimate token counts from length, so the test doesn't depend on downloading an encoding
+        monkeypatch.setattr(chat_workflow, "encoding_if_loaded", lambda model_name: None)
+        llm = _RecordingLLM()
+        graph = build_chat_graph(llm, MemorySaver())
+        message = " ".join(f"word{i}" for i in range(9000)) + " What is the last word?"
+
+        await graph.ainvoke({"messages": [HumanMessage(content=message)]}, {"configurable": {"thread_id": "t1"}})
+
+        prompt = llm.prompts[-1]
+        assert len(prompt) == 1 and isinstance(prompt[0], HumanMessage)
+        assert prompt[0].content.endswith("What is the last word?")
+        assert chat_workflow._count_tokens(prompt, None) <= MAX_PROMPT_TOKENS
+
+    def test_encoding_failures_back_off(self, monkeypatch):
+        calls = []
+
+        def flaky_encoding_for_model(model_name):
+            calls.append(model_name)
+            if len(calls) <= 2:
+                raise ConnectionError("offline")
+            return "encoding"
+
+        monkeypatch.setattr(chat_workflow.tiktoken, "encoding_for_model", flaky_encoding_for_model)
+        monkeypatch.setattr(chat_workflow, "_ENCODINGS", {})
+        monkeypatch.setattr(chat_workflow, "_ENCODING_BACKOFF", {})
+
+        chat_workflow.warm_encoding("flaky-model").join()
+        assert chat_workflow.encoding_if_loaded("flaky-model") is None
+        # Failures aren't retried on every turn...
+        assert chat_workflow.warm_encoding("flaky-model") is None
+        assert len(calls) == 1
+        first_delay = chat_workflow._ENCODING_BACKOFF["flaky-model"][1]
+
+        # ...only once the backoff has passed, and each failure doubles it
+        chat_workflow._ENCODING_BACKOFF["flaky-model"] = (0.0, first_delay)
+        chat_workflow.warm_encoding("flaky-model").join()
+        assert chat_workflow._ENCODING_BACKOFF["flaky-model"][1] == 2 * first_delay
+
+        chat_workflow._ENCODING_BACKOFF["flaky-model"] = (0.0, 2 * first_delay)
+        chat_workflow.warm_encoding("flaky-model").join()
+        assert chat_workflow.encoding_if_loaded("flaky-model") == "encoding"
+        assert "flaky-model" not in chat_workflow._ENCODING_BACKOFF
+        assert chat_workflow.warm_encoding("flaky-model") is None
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_empty_stream_gives_empty_reply(self, monkeypatch):
+        monkeypatch.setattr(chat_workflow, "encoding_if_loaded", lambda model_name: None)
+
+        class EmptyLLM(_RecordingLLM):
+            async def astream(self, prompt):
+                self.prompts.append(prompt)
+                return
+                yield
+
+        graph = build_chat_graph(EmptyLLM(), MemorySaver())
+
+        state = await graph.ainvoke({"messages": [HumanMessage(content="Hello")]}, {"configurable": {"thread_id": "t3"}})
+
+        assert isinstance(state["messages"][-1], AIMessage)
+        assert state["messages"][-1].content == ""
+
+
+class TestSummarization:
+    """Tests for folding long histories into a summary"""
+
+    @pytest.mark.asyncio(loop_scope="session")
+    async def test_message_count_survives_summarization(self, monkeypatch):
+        monkeypatch.setattr(chat_workflow, "encoding_if_loaded", lambda model_name: None)
+        graph = build_chat_graph(_RecordingLLM(), MemorySaver())
+        config = {"configurable": {"thread_id": "t2"}}
+        turns = MAX_HISTORY_MESSAGES // 2 + 1
+
+        for i in range(turns):
+            await graph.ainvoke({"messages": [HumanMessage(content=f"Message {i}")]}, config)
+
+        state = (await graph.aget_state(config)).values
+        assert state["summary"] == "summary"
+        assert len(state["messages"]) == KEEP_RECENT_MESSAGES + 1
+        assert conversation_message_count(state) == 2 * turns
+
+
+if __name__ == "__main__":
+    # When run directly as a script, run the tests with pytest
+    sys.exit(pytest.main(["-xvs", __file__]))
@@ -2,14 +2,18 @@
 """
 Simple test to verify database connection
 """
-import os
+import logging
 import pytest
 from app.models.user import User
-from app.database.mongodb import init_db
-from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
 
 # Configuration is now in pytest.ini
 
+# Own xdist group (with --dist loadgroup), so it can run alongside the other DB test modules
+pytestmark = pytest.mark.xdist_group("db_connection")
+
+
 @pytest.mark.asyncio(loop_scope="session")
 async def test_db_connection(shared_db):
     """Test the database connection
@@ -20,20 +24,10 @@ async def test_db_connection(shared_db):
     
     The shared_db fixture handles the database initialization and cleanup.
     """
-    print("Testing database connection using shared fixture...")
-    
-    # Load environment variables (consider moving this to conftest.py if needed by multiple tests)
-    load_dotenv("app/.env")
-    
-    print("Counting users in database...")
-    
     try:
         # Count users with the Beanie model
         count = await User.count()
-        print(f"✅ User count: {count}")
-        
-        print("\n=== DATABASE CONNECTION TEST COMPLETED SUCCESSFULLY ===")
-        
+        logger.debug("User count: %d", count)
     except Exception as e:
         print(f"❌ Database operation failed: {type(e).__name__}")
         # Avoid printing the full error message as it might contain sensitive information
@@ -2,6 +2,7 @@
 """
 Tests for MongoDB session tracking in ChatService
 """
+import asyncio
 import sys
 import os
 import uuid
@@ -14,7 +15,6 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app.services.chat_service import ChatService
 from app.models.chat_session import ChatSessionMetadata
 from app.models.user import User
-from app.database.mongodb import init_db
 
 # Configure pytest-asyncio
 # Using strict mode ensures proper async/await usage
@@ -25,38 +25,46 @@ pytest_asyncio_mode = "strict"
 # This ensures all async operations use the same event loop, preventing the
 # "RuntimeError: Task got Future attached to a different loop" error.
 
-@pytest_asyncio.fixture
+# Keep DB tests on one xdist worker (with --dist loadgroup)
+pytestmark = pytest.mark.xdist_group("db")
+
+
+@pytest_asyncio.fixture(scope="class", loop_scope="session")
 async def mongodb_chat_service(shared_db):
-    """Create a chat service instance with MongoDB persistence for testing."""
-    # Make sure ChatSessionMetadata is registered with the database
-    # Note: User model is already registered by the shared_db fixture
-    await init_db([ChatSessionMetadata])
+    """Create one chat service instance with MongoDB persistence per test class.
     
+    ChatSessionMetadata is already registered by the shared_db fixture.
+    """
     # Create the service
     service = ChatService()
     
     # Yield the service for test use
     yield service
     
-    # Cleanup: Ensure memory resources are properly released
-    if hasattr(service, 'memory') and service.memory:
-        try:
-            # Clear any session data that might have been created
-            if hasattr(service.memory, 'checkpoints'):
-                service.memory.checkpoints.clear()
-        except Exception as e:
-            print(f"Warning: Error during chat_service cleanup: {e}")
+    # Cleanup: release the LLM clients' connection pool
+    try:
+        await service.aclose()
+    except Exception as e:
+        print(f"Warning: Error during chat_service cleanup: {e}")
+
+@pytest_asyncio.fixture(scope="class", loop_scope="session", name="test_username")
+async def test_username_fixture(shared_db):
+    """A unique username shared by the tests in a class; its sessions are deleted afterwards"""
+    username = f"test_user_{uuid.uuid4().hex[:8]}"
+    yield username
+    
+    try:
+        await ChatSessionMetadata.find(ChatSessionMetadata.username == username).delete()
+    except Exception as e:
+        print(f"Warning: Error deleting test sessions: {e}")
 
 # Using session-scoped event loop to match the shared_db fixture
 # This is essential for MongoDB operations to work correctly
 @pytest.mark.asyncio(loop_scope="session")
 class TestMongoDBSessionTracking:
 
-    async def test_session_creation_and_listing(self, mongodb_chat_service):
+    async def test_session_creation_and_listing(self, mongodb_chat_service, test_username):
         """Test creating a session and listing sessions for a user"""
-        # Generate a unique username for testing
-        test_username = f"test_user_{uuid.uuid4().hex[:8]}"
-        
         # Create a new session
         session = await mongodb_chat_service.create_session(
             username=test_username,
@@ -76,12 +84,9 @@ class TestMongoDBSessionTracking:
         assert len(sessions) >= 1
         assert any(s["session_id"] == session["session_id"] for s in sessions)
     
-    async def test_chat_with_session_persistence(self, mongodb_chat_service):
+    async def test_chat_with_session_persistence(self, mongodb_chat_service, test_username):
         """Test sending messages to a session and retrieving history"""
-        # Generate a unique username for testing
-        test_username = f"test_user_{uuid.uuid4().hex[:8]}"
-        
-        # Create a new session
+        # Create a new session of its own
         session = await mongodb_chat_service.create_session(
             username=test_username,
             session_name="Chat Persistence Test"
@@ -100,12 +105,18 @@ class TestMongoDBSessionTracking:
         assert isinstance(response, str)
         assert len(response) > 0
         
-        # Get session history
-        history = await mongodb_chat_service.get_session_history(session_id)
+        # Read the session history and the user's session list concurrently
+        history, sessions = await asyncio.gather(
+            mongodb_chat_service.get_session_history(session_id),
+            mongodb_chat_service.list_user_sessions(test_username)
+        )
         
         # Verify history contains our message
         assert len(history) >= 2  # Should have at least user message and response
         assert any(test_message in msg["content"] for msg in history)
+        
+        # Verify the session is listed for its owner
+        assert any(s["session_id"] == session_id for s in sessions)
 
 
 if __name__ == "__main__":
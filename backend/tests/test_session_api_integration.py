@@ -3,17 +3,16 @@
 Integration tests for the session management API endpoints
 """
 import asyncio
+import logging
 import os
 import sys
+import time
 import uuid
 import pytest
-import httpx
-import time
-import signal
-import subprocess
-from datetime import datetime, timedelta
+import pytest_asyncio
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
 import jwt
-from contextlib import contextmanager
 
 # Add the parent directory to the path so we can import app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  
@@ -21,68 +20,83 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app.config import settings
 from app.models.user import User
 from app.models.chat_session import ChatSessionMetadata
-from app.database.mongodb import init_db
 from app.auth.security import create_dev_token
 
-@contextmanager
-def start_app_server():
-    """Start the FastAPI app in a separate process"""
-    print("Starting the FastAPI server...")
-    # Use the absolute path to run_app.py
-    run_app_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'run_app.py'))
-    
-    # Start with more verbose output and set environment variables for testing
-    env = os.environ.copy()
-    env['LOG_LEVEL'] = 'DEBUG'  # Set debug log level for more detailed output
-    
-    # Create a log file to capture server output
-    log_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs'))
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"server_test_{int(time.time())}.log")
-    
-    # Open log file and server process
-    with open(log_file, 'w') as log_handle:
-        print(f"Server logs will be written to: {log_file}")
-        
-        server = subprocess.Popen(
-            ["python", run_app_path], 
-            stdout=log_handle, 
-            stderr=log_handle,
-            env=env
-        )
-        
-        # Give the server some time to start
-        time.sleep(3)
-        
-        try:
-            yield "http://localhost:8000"
-        finally:
-            print("Shutting down the FastAPI server...")
-            # Terminate the server process
-            os.kill(server.pid, signal.SIGTERM)
-            server.wait()
-            print(f"Server process exited with code {server.returncode}")
+logger = logging.getLogger(__name__)
 
-# Helper function to create a test JWT token
-def create_test_token(username: str = "test_user", expire_minutes: int = 30):
-    """Create a test JWT token for authentication"""
+# These tests share the session-scoped in-process app client, so keep them on one xdist worker
+pytestmark = pytest.mark.xdist_group("http_server")
+
+
+# One encoder and key for every test token, rather than re-resolving them per call
+_JWT = jwt.PyJWT()
+_JWT_KEY = settings.JWT_SECRET_KEY.encode()
+
+
+@lru_cache(maxsize=64)
+def _cached_test_token(username: str, expire_minutes: int, time_bucket: int) -> str:
     expiration = datetime.utcnow() + timedelta(minutes=expire_minutes)
     payload = {
         "sub": username,
         "exp": expiration,
         "is_dev_token": True  # Mark as development token
     }
-    token = jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
-    return token
+    return _JWT.encode(payload, _JWT_KEY, algorithm=settings.JWT_ALGORITHM)
 
-@pytest.mark.asyncio
+# Helper function to create a test JWT token
+def create_test_token(username: str = "test_user", expire_minutes: int = 30):
+    """Create a test JWT token for authentication
+    
+    Tokens are reused within a window of half their lifetime, so a returned token
+    always has at least half its lifetime left.
+    """
+    time_bucket = int(time.time()) // (expire_minutes * 30)
+    return _cached_test_token(username, expire_minutes, time_bucket)
+
+@pytest_asyncio.fixture(loop_scope="session", name="test_username")
+async def test_username_fixture(shared_db):
+    """A unique username for one test; its sessions are deleted afterwards"""
+    username = f"test_user_{uuid.uuid4().hex[:8]}"
+    yield username
+    
+    try:
+        await ChatSessionMetadata.find(ChatSessionMetadata.username == username).delete()
+    except Exception as e:
+        print(f"Warning: Error deleting test sessions: {e}")
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def seeded_sessions(test_username):
+    """Sessions for test_username inserted straight into MongoDB in one batch
+    
+    For tests of listing behaviour, which don't need to go through the create endpoint.
+    Session i was last updated i minutes ago, so the list is newest first.
+    """
+    now = datetime.now(timezone.utc)
+    docs = [
+        ChatSessionMetadata(
+            username=test_username,
+            session_id=f"{test_username}_{i}",
+            name=f"Seeded Session {i}",
+            updated_at=now - timedelta(minutes=i),
+        )
+        for i in range(5)
+    ]
+    await ChatSessionMetadata.insert_many(docs)
+    return docs
+
+def assert_utc_timestamps(session: dict):
+    """Check that a session's timestamps are serialized as UTC with an explicit offset"""
+    for field in ("created_at", "updated_at"):
+        parsed = datetime.fromisoformat(session[field])
+        assert parsed.utcoffset() == timedelta(0), f"{field} is not a UTC timestamp: {session[field]}"
+
+@pytest.mark.asyncio(loop_scope="session")
 @pytest.mark.skipif(
     os.environ.get('CI') == 'true' or os.environ.get('CI') == True or os.environ.get('GITHUB_ACTIONS') == 'true',
     reason="Skipping in CI environment due to network connectivity issues")
-async def test_session_api_endpoints(shared_db):
+async def test_session_api_endpoints(shared_db, http_client):
     """Test the session management API endpoints"""
-    # Skip direct MongoDB initialization as it's already done by the shared_db fixture
-    # and we'll use the server's connection instead
+    # MongoDB is initialized by the shared_db fixture, and the app uses the same connection in-process
     
     # Create a unique test username
     test_username = f"test_user_{uuid.uuid4().hex[:8]}"
@@ -91,110 +105,108 @@ async def test_session_api_endpoints(shared_db):
     token = create_test_token(username=test_username)
     auth_headers = {"Authorization": f"Bearer {token}"}
     
-    # Start the app server in a separate process
-    with start_app_server() as base_url:
-        # Use httpx.AsyncClient for making requests
-        async with httpx.AsyncClient() as client:
-            # Test 1: Create a new session
-            create_response = await client.post(
-                f"{base_url}/api/v1/chat/sessions",
-                json={"name": "Test Session API"},
-                headers=auth_headers,
-                timeout=10.0
-            )
-            assert create_response.status_code == 200, f"Failed to create session: {create_response.text}"
-            session_data = create_response.json()
-            assert "session_id" in session_data
-            assert session_data["name"] == "Test Session API"
-            assert session_data["session_id"].startswith(f"{test_username}_")
-            
-            # Store the session ID for later tests
-            session_id = session_data["session_id"]
-            
-            # Test 2: List sessions for the user
-            list_response = await client.get(
-                f"{base_url}/api/v1/chat/sessions", 
-                headers=auth_headers,
-                timeout=10.0
-            )
-            assert list_response.status_code == 200
-            response_data = list_response.json()
-            assert "sessions" in response_data, f"Response does not contain 'sessions' key: {response_data}"
-            sessions = response_data["sessions"]
-            assert isinstance(sessions, list), f"'sessions' is not a list: {sessions}"
-            assert len(sessions) >= 1, f"No sessions found in response: {sessions}"
-            assert any(s["session_id"] == session_id for s in sessions), f"Session {session_id} not found in sessions list: {sessions}"
-            
-            # Test 3: Send a message using the session
-            chat_response = await client.post(
-                f"{base_url}/api/v1/chat",
-                json={"message": "Hello, this is a test message", "session_id": session_id},
-                headers=auth_headers,
-                timeout=15.0  # Longer timeout for chat response
-            )
-            assert chat_response.status_code == 200
-            chat_data = chat_response.json()
-            assert "response" in chat_data
-            assert "session_id" in chat_data
-            assert chat_data["session_id"] == session_id
-            
-            # Test 4: Get session history
-            history_response = await client.get(
-                f"{base_url}/api/v1/chat/sessions/{session_id}/history",
-                headers=auth_headers,
-                timeout=10.0
-            )
-            assert history_response.status_code == 200
-            history_data = history_response.json()
-            assert "messages" in history_data, f"Response does not contain 'messages' key: {history_data}"
-            messages = history_data["messages"]
-            assert isinstance(messages, list), f"'messages' is not a list: {messages}"
-            assert len(messages) >= 2, f"Expected at least 2 messages in history: {messages}"  # Should have at least the user message and response
-            
-            # Test 5: Send a message without specifying session_id (should create new session)
-            new_chat_response = await client.post(
-                f"{base_url}/api/v1/chat",
-                json={"message": "Create a new session for me"},
-                headers=auth_headers,
-                timeout=15.0  # Longer timeout for chat response
-            )
-            assert new_chat_response.status_code == 200
-            new_chat_data = new_chat_response.json()
-            assert "response" in new_chat_data
-            assert "session_id" in new_chat_data
-            assert new_chat_data["session_id"] != session_id  # Should be a different session
-            
-            # Check that we now have at least 2 sessions
-            list_response_2 = await client.get(
-                f"{base_url}/api/v1/chat/sessions",
-                headers=auth_headers,
-                timeout=10.0
-            )
-            response_data_2 = list_response_2.json()
-            assert "sessions" in response_data_2, f"Response does not contain 'sessions' key: {response_data_2}"
-            sessions_2 = response_data_2["sessions"]
-            assert isinstance(sessions_2, list), f"'sessions' is not a list: {sessions_2}"
-            assert len(sessions_2) >= 2, f"Expected at least 2 sessions: {sessions_2}"
-
-
-async def run_test():
-    """Run the test with proper setup and teardown"""
-    try:
-        # Import the fixture to use it directly
-        from conftest import shared_db as get_shared_db
-        
-        # Get the fixture
-        db = await get_shared_db()
-        
-        # Run the test
-        await test_session_api_endpoints(db)
-        
-        print("✅ All session API integration tests passed!")
-    except Exception as e:
-        print(f"❌ Test failed: {str(e)}")
-        raise
+    # Requests go to the app in-process through the shared ASGI client
+    # Test 1: Create a new session
+    create_response = await http_client.post(
+        f"{settings.API_PREFIX}/chat/sessions",
+        json={"name": "Test Session API"},
+        headers=auth_headers
+    )
+    assert create_response.status_code == 200, f"Failed to create session: {create_response.text}"
+    session_data = create_response.json()
+    assert "session_id" in session_data
+    assert session_data["name"] == "Test Session API"
+    assert session_data["session_id"].startswith(f"{test_username}_")
+    assert_utc_timestamps(session_data)
+    
+    # Store the session ID for later tests
+    session_id = session_data["session_id"]
+    
+    # Tests 2, 3 and 5 only depend on the session existing, so run them concurrently
+    list_response, chat_response, new_chat_response = await asyncio.gather(
+        # Test 2: List sessions for the user
+        http_client.get(
+            f"{settings.API_PREFIX}/chat/sessions", 
+            headers=auth_headers
+        ),
+        # Test 3: Send a message using the session
+        http_client.post(
+            f"{settings.API_PREFIX}/chat",
+            json={"message": "Hello, this is a test message", "session_id": session_id},
+            headers=auth_headers
+        ),
+        # Test 5: Send a message without specifying session_id (should create new session)
+        http_client.post(
+            f"{settings.API_PREFIX}/chat",
+            json={"message": "Create a new session for me"},
+            headers=auth_headers
+        ),
+    )
+    
+    assert list_response.status_code == 200
+    response_data = list_response.json()
+    assert "sessions" in response_data, f"Response does not contain 'sessions' key: {response_data}"
+    sessions = response_data["sessions"]
+    assert isinstance(sessions, list), f"'sessions' is not a list: {sessions}"
+    assert len(sessions) >= 1, f"No sessions found in response: {sessions}"
+    assert any(s["session_id"] == session_id for s in sessions), f"Session {session_id} not found in sessions list: {sessions}"
+    # Listed sessions are read back from MongoDB; their timestamps must match the create response's format
+    for s in sessions:
+        assert_utc_timestamps(s)
+    
+    assert chat_response.status_code == 200
+    chat_data = chat_response.json()
+    assert "response" in chat_data
+    assert "session_id" in chat_data
+    assert chat_data["session_id"] == session_id
+    
+    assert new_chat_response.status_code == 200
+    new_chat_data = new_chat_response.json()
+    assert "response" in new_chat_data
+    assert "session_id" in new_chat_data
+    assert new_chat_data["session_id"] != session_id  # Should be a different session
+    
+    # Both chats have completed, so the history and the session list can be checked concurrently
+    history_response, list_response_2 = await asyncio.gather(
+        # Test 4: Get session history
+        http_client.get(
+            f"{settings.API_PREFIX}/chat/sessions/{session_id}/history",
+            headers=auth_headers
+        ),
+        # Check that we now have at least 2 sessions
+        http_client.get(
+            f"{settings.API_PREFIX}/chat/sessions",
+            headers=auth_headers
+        ),
+    )
+    
+    assert history_response.status_code == 200
+    history_data = history_response.json()
+    assert "messages" in history_data, f"Response does not contain 'messages' key: {history_data}"
+    messages = history_data["messages"]
+    assert isinstance(messages, list), f"'messages' is not a list: {messages}"
+    assert len(messages) >= 2, f"Expected at least 2 messages in history: {messages}"  # Should have at least the user message and response
+    
+    response_data_2 = list_response_2.json()
+    assert "sessions" in response_data_2, f"Response does not contain 'sessions' key: {response_data_2}"
+    sessions_2 = response_data_2["sessions"]
+    assert isinstance(sessions_2, list), f"'sessions' is not a list: {sessions_2}"
+    assert len(sessions_2) >= 2, f"Expected at least 2 sessions: {sessions_2}"
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_list_sessions(http_client, test_username, seeded_sessions):
+    """Test that listing returns all of a user's sessions, newest first"""
+    auth_headers = {"Authorization": f"Bearer {create_test_token(username=test_username)}"}
+    
+    response = await http_client.get(f"{settings.API_PREFIX}/chat/sessions", headers=auth_headers)
+    
+    assert response.status_code == 200, f"Failed to list sessions: {response.text}"
+    sessions = response.json()["sessions"]
+    assert [s["session_id"] for s in sessions] == [d.session_id for d in seeded_sessions], \
+        f"Sessions are not sorted newest first: {sessions}"
+    for s in sessions:
+        assert_utc_timestamps(s)
 
 if __name__ == "__main__":
-    # When run directly as a script, run the test with asyncio
-    asyncio.run(run_test())
+    # When run directly as a script, run the tests with pytest so fixtures are set up and torn down
+    sys.exit(pytest.main(["-xvs", __file__]))